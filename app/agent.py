@@ -1,12 +1,65 @@
-from datetime import datetime, date
-from typing import Dict, Optional
+from datetime import datetime, date, timedelta, timezone
+from typing import Dict, Optional, Tuple
+import threading
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import bindparam, func, select, update, Row
 from app.database import Transaction, DailyLimit
 from app.config import get_settings
 
 settings = get_settings()
 
+# Columns needed to report spending status; cached rows and RETURNING rows share this shape
+DAILY_LIMIT_COLUMNS = (
+    DailyLimit.date,
+    DailyLimit.limit_amount,
+    DailyLimit.spent_amount,
+    DailyLimit.transaction_count,
+)
+
+# Hot-path statements are built once at import and executed with bound parameters
+SELECT_DAILY_LIMIT = select(*DAILY_LIMIT_COLUMNS).where(DailyLimit.date == bindparam("today"))
+
+INCREMENT_DAILY_LIMIT = (
+    update(DailyLimit)
+    .where(DailyLimit.date == bindparam("today"))
+    .values(
+        spent_amount=DailyLimit.spent_amount + bindparam("amount"),
+        transaction_count=DailyLimit.transaction_count + 1
+    )
+    .returning(*DAILY_LIMIT_COLUMNS)
+)
+
+# Action phrase for each outgoing transaction type, used by generate_message
+_ACTION_FORMATTERS = {
+    "SENT": lambda amount, recipient: f"sent Ksh{amount:,.2f} to {recipient}" if recipient else f"sent Ksh{amount:,.2f}",
+    "WITHDRAWN": lambda amount, recipient: f"withdrew Ksh{amount:,.2f}",
+    "BOUGHT": lambda amount, recipient: f"bought airtime worth Ksh{amount:,.2f}",
+    "PAYBILL": lambda amount, recipient: f"paid Ksh{amount:,.2f} via Paybill",
+}
+
+
+def _default_action(amount: float, recipient: Optional[str]) -> str:
+    return f"spent Ksh{amount:,.2f}"
+
+
+# Today's daily limit row, shared by the per-request agents. Every write in this process
+# refreshes or drops it; the lock covers the reconciliation job running in a worker thread.
+_today_cache: Optional[Tuple[str, Row]] = None
+_today_cache_lock = threading.Lock()
+
+
+def _get_cached_daily_limit(today: str) -> Optional[Row]:
+    with _today_cache_lock:
+        if _today_cache is not None and _today_cache[0] == today:
+            return _today_cache[1]
+    return None
+
+
+def _set_cached_daily_limit(today: str, daily_limit: Optional[Row]):
+    global _today_cache
+    with _today_cache_lock:
+        _today_cache = (today, daily_limit) if daily_limit is not None else None
+
 
 class SpendingAgent:
     """Intelligent agent to track spending and generate insights"""
@@ -20,48 +73,90 @@ class SpendingAgent:
         """Get today's date as string"""
         return date.today().isoformat()
 
-    def get_or_create_daily_limit(self) -> DailyLimit:
-        """Get or create daily limit record for today"""
+    def get_or_create_daily_limit(self) -> Row:
+        """Get or create daily limit record for today, cached until the date changes"""
         today = self.get_today_date()
-        daily_limit = self.db.query(DailyLimit).filter(DailyLimit.date == today).first()
+        daily_limit = _get_cached_daily_limit(today)
+        if daily_limit is not None:
+            return daily_limit
+
+        daily_limit = self.db.execute(SELECT_DAILY_LIMIT, {"today": today}).first()
 
         if not daily_limit:
-            daily_limit = DailyLimit(
+            self.db.add(DailyLimit(
                 date=today,
                 limit_amount=self.daily_limit,
                 spent_amount=0.0,
                 transaction_count=0
-            )
-            self.db.add(daily_limit)
+            ))
             self.db.commit()
-            self.db.refresh(daily_limit)
+            daily_limit = self.db.execute(SELECT_DAILY_LIMIT, {"today": today}).one()
 
+        _set_cached_daily_limit(today, daily_limit)
         return daily_limit
 
-    def calculate_today_spending(self) -> float:
-        """Calculate total spending for today"""
-        today_start = datetime.combine(date.today(), datetime.min.time())
+    def update_daily_limit(self, transaction_amount: float) -> Row:
+        """Add transaction to today's running total in one UPDATE and return the updated row
 
-        spent_transactions = self.db.query(func.sum(Transaction.amount)).filter(
-            Transaction.transaction_type.in_(["SENT", "WITHDRAWN", "BOUGHT", "PAYBILL"]),
-            Transaction.timestamp >= today_start
-        ).scalar()
+        Commits the session, so any pending transaction insert lands in the same unit of work.
+        """
+        today = self.get_today_date()
+        params = {"today": today, "amount": transaction_amount}
 
-        return spent_transactions or 0.0
+        daily_limit = self.db.execute(INCREMENT_DAILY_LIMIT, params).first()
+        if daily_limit is None:
+            # First transaction of the day - create the record without committing, then increment
+            self.db.add(DailyLimit(
+                date=today,
+                limit_amount=self.daily_limit,
+                spent_amount=0.0,
+                transaction_count=0
+            ))
+            self.db.flush()
+            daily_limit = self.db.execute(INCREMENT_DAILY_LIMIT, params).one()
+
+        self.db.commit()
+        _set_cached_daily_limit(today, daily_limit)
+        return daily_limit
 
-    def update_daily_limit(self, transaction_amount: float):
-        """Update daily limit record with new transaction"""
-        daily_limit = self.get_or_create_daily_limit()
-        daily_limit.spent_amount = self.calculate_today_spending()
-        daily_limit.transaction_count += 1
-        daily_limit.updated_at = datetime.utcnow()
+    def reconcile_daily_limit(self, day: Optional[date] = None):
+        """Recompute a day's running total from its transactions to heal any drift"""
+        day = day or date.today()
+        # Rows are keyed by local date but timestamps are stored in UTC, so convert the
+        # local midnight boundaries to naive UTC before comparing
+        day_start = datetime.combine(day, datetime.min.time()).astimezone(timezone.utc).replace(tzinfo=None)
+        day_end = datetime.combine(day + timedelta(days=1), datetime.min.time()).astimezone(timezone.utc).replace(tzinfo=None)
+
+        day_transactions = (
+            Transaction.transaction_type.in_(["SENT", "WITHDRAWN", "BOUGHT", "PAYBILL"]),
+            Transaction.timestamp >= day_start,
+            Transaction.timestamp < day_end
+        )
+
+        # Sums are correlated subqueries so the recompute and the write are one statement and a
+        # webhook increment committed meanwhile can't be overwritten by a stale total
+        self.db.execute(
+            update(DailyLimit)
+            .where(DailyLimit.date == day.isoformat())
+            .values(
+                spent_amount=select(func.coalesce(func.sum(Transaction.amount), 0.0))
+                .where(*day_transactions)
+                .scalar_subquery(),
+                transaction_count=select(func.count(Transaction.id))
+                .where(*day_transactions)
+                .scalar_subquery()
+            )
+        )
         self.db.commit()
+        _set_cached_daily_limit(day.isoformat(), None)
 
-    def check_spending_status(self) -> Dict:
+    def check_spending_status(self, daily_limit=None) -> Dict:
         """Check current spending status against limit"""
-        daily_limit = self.get_or_create_daily_limit()
-        spent = daily_limit.spent_amount
-        limit = daily_limit.limit_amount
+        if daily_limit is None:
+            daily_limit = self.get_or_create_daily_limit()
+        # RETURNING rows from SQLite can hand back whole REAL values as ints
+        spent = float(daily_limit.spent_amount)
+        limit = float(daily_limit.limit_amount)
         remaining = limit - spent
         percentage_used = (spent / limit) * 100 if limit > 0 else 0
 
@@ -94,18 +189,9 @@ class SpendingAgent:
         status = spending_status["status"]
 
         # Build message based on transaction type
-        if trans_type == "SENT":
-            action = f"sent Ksh{amount:,.2f} to {recipient}" if recipient else f"sent Ksh{amount:,.2f}"
-        elif trans_type == "WITHDRAWN":
-            action = f"withdrew Ksh{amount:,.2f}"
-        elif trans_type == "BOUGHT":
-            action = f"bought airtime worth Ksh{amount:,.2f}"
-        elif trans_type == "PAYBILL":
-            action = f"paid Ksh{amount:,.2f} via Paybill"
-        elif trans_type == "RECEIVED":
+        if trans_type == "RECEIVED":
             return f"💰 You received Ksh{amount:,.2f}! Current balance updated."
-        else:
-            action = f"spent Ksh{amount:,.2f}"
+        action = _ACTION_FORMATTERS.get(trans_type, _default_action)(amount, recipient)
 
         # Status-based messages
         if status == "EXCEEDED":
@@ -131,23 +217,25 @@ class SpendingAgent:
 
     def get_weekly_summary(self) -> Dict:
         """Generate weekly spending summary"""
-        from datetime import timedelta
-        
         week_ago = datetime.now() - timedelta(days=7)
         
-        weekly_spent = self.db.query(func.sum(Transaction.amount)).filter(
-            Transaction.transaction_type.in_(["SENT", "WITHDRAWN", "BOUGHT", "PAYBILL"]),
-            Transaction.timestamp >= week_ago
-        ).scalar() or 0.0
-
-        weekly_received = self.db.query(func.sum(Transaction.amount)).filter(
-            Transaction.transaction_type == "RECEIVED",
-            Transaction.timestamp >= week_ago
-        ).scalar() or 0.0
-
-        transaction_count = self.db.query(func.count(Transaction.id)).filter(
+        totals_by_type = self.db.query(
+            Transaction.transaction_type,
+            func.sum(Transaction.amount),
+            func.count(Transaction.id)
+        ).filter(
             Transaction.timestamp >= week_ago
-        ).scalar() or 0
+        ).group_by(Transaction.transaction_type).all()
+
+        weekly_spent = 0.0
+        weekly_received = 0.0
+        transaction_count = 0
+        for trans_type, total, count in totals_by_type:
+            if trans_type in ["SENT", "WITHDRAWN", "BOUGHT", "PAYBILL"]:
+                weekly_spent += total or 0.0
+            elif trans_type == "RECEIVED":
+                weekly_received += total or 0.0
+            transaction_count += count
 
         return {
             "total_spent": weekly_spent,
@@ -1,16 +1,67 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Float, DateTime, Boolean, Index
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.pool import QueuePool
 from app.config import get_settings
 
 settings = get_settings()
 
+# Pool sizing only applies to QueuePool (file-based SQLite, PostgreSQL); in-memory
+# SQLite uses a SingletonThreadPool, which rejects these arguments
+database_url = make_url(settings.database_url)
+pool_options = {}
+if issubclass(database_url.get_dialect().get_pool_class(database_url), QueuePool):
+    pool_options = {"pool_size": 10, "max_overflow": 20}
+
 engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
+    database_url,
+    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {},
+    **pool_options
 )
 
+if "sqlite" in settings.database_url:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so /status and /transactions reads don't block webhook writes"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.close()
+
+# Dialect-specific INSERT so callers can use ON CONFLICT on both PostgreSQL and SQLite
+insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+
+class utcnow(FunctionElement):
+    """Current UTC time as a naive timestamp, in the same form SQLAlchemy writes for datetimes"""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def compile_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, "sqlite")
+def compile_utcnow_sqlite(element, compiler, **kw):
+    # SQLite compares datetimes as text, so match SQLAlchemy's 'YYYY-MM-DD HH:MM:SS.ffffff'
+    # rather than CURRENT_TIMESTAMP's whole seconds ('now' is UTC)
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+@compiles(utcnow, "postgresql")
+def compile_utcnow_postgresql(element, compiler, **kw):
+    # now() is session-local time; convert it before it lands in a column without time zone
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -18,29 +69,44 @@ Base = declarative_base()
 class Transaction(Base):
     __tablename__ = "transactions"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     transaction_code = Column(String, unique=True, index=True)
-    transaction_type = Column(String, index=True)
+    transaction_type = Column(String)
     amount = Column(Float)
     recipient = Column(String, nullable=True)
     balance = Column(Float, nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    timestamp = Column(DateTime, server_default=utcnow())
     raw_message = Column(String)
     sender = Column(String)
     processed = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+
+
+# Composite indexes for the spending aggregates (type IN (...) AND timestamp >= X)
+# and the weekly count (timestamp >= X); they replace the single-column indexes
+Index("ix_tx_type_ts", Transaction.transaction_type, Transaction.timestamp)
+Index("ix_tx_ts_type", Transaction.timestamp, Transaction.transaction_type)
+
+# Indexes older databases still carry; init_db drops them so inserts stop maintaining them
+REPLACED_INDEXES = (
+    "ix_transactions_transaction_type",
+    "ix_transactions_timestamp",
+    # Duplicated the primary keys
+    "ix_transactions_id",
+    "ix_daily_limits_id",
+)
 
 
 class DailyLimit(Base):
     __tablename__ = "daily_limits"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     date = Column(String, unique=True, index=True)
     limit_amount = Column(Float)
     spent_amount = Column(Float, default=0.0)
     transaction_count = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 def get_db():
@@ -51,5 +117,53 @@ def get_db():
         db.close()
 
 
+def add_server_defaults():
+    """Give tables created before timestamps moved to server-side defaults those defaults"""
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+        missing = [
+            column for column in table.columns
+            if column.server_default is not None and existing[column.name]["default"] is None
+        ]
+        if not missing:
+            continue
+
+        with engine.begin() as conn:
+            if engine.dialect.name == "sqlite":
+                # SQLite can't change a column default in place, so rebuild the table. pysqlite
+                # only opens a transaction before DML, so BEGIN explicitly to make the DDL roll
+                # back with it if anything fails part-way
+                conn.exec_driver_sql("BEGIN")
+                old_name = f"{table.name}_old"
+                for index in inspector.get_indexes(table.name):
+                    conn.exec_driver_sql(f"DROP INDEX {quote(index['name'])}")
+                conn.exec_driver_sql(f"ALTER TABLE {quote(table.name)} RENAME TO {quote(old_name)}")
+                table.create(conn)
+                columns = ", ".join(quote(column.name) for column in table.columns)
+                conn.exec_driver_sql(
+                    f"INSERT INTO {quote(table.name)} ({columns}) SELECT {columns} FROM {quote(old_name)}"
+                )
+                conn.exec_driver_sql(f"DROP TABLE {quote(old_name)}")
+            else:
+                for column in missing:
+                    default = column.server_default.arg.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {quote(table.name)} ALTER COLUMN {quote(column.name)} SET DEFAULT {default}"
+                    )
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    add_server_defaults()
+    # create_all skips tables that already exist, so add any indexes missing from older databases
+    for index in Transaction.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for name in REPLACED_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {quote(name)}")
@@ -1,21 +1,57 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from datetime import datetime
-from app.database import get_db, init_db, Transaction
-from app.parser import MpesaParser
-from app.agent import SpendingAgent
-from app.slack import send_slack_notification, send_test_message
+from sqlalchemy import select, text
+from datetime import datetime, date
+import asyncio
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from cachetools import TTLCache
+from app.database import get_db, init_db, insert, SessionLocal, Transaction
 from app.config import get_settings
 
+# app.parser, app.agent and app.slack (httpx) are imported inside the endpoints that
+# use them so startup and the lightweight endpoints don't pay for them
+
 settings = get_settings()
 
+# Handlers only enqueue records; a listener thread does the actual stderr writes
+logger = logging.getLogger("mpesa")
+log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+stderr_handler = logging.StreamHandler()
+stderr_handler.setFormatter(logging.Formatter("%(message)s"))
+log_listener = QueueListener(log_queue, stderr_handler)
+
+# Built once at import; rows whose transaction_code already exists are skipped
+INSERT_TRANSACTION = insert(Transaction).on_conflict_do_nothing(
+    index_elements=["transaction_code"]
+).returning(Transaction.id)
+
+# Short-lived caches for dashboard polling. Keys include a version that every write bumps,
+# so a new transaction is visible on the next poll rather than after the TTL
+status_cache = TTLCache(maxsize=8, ttl=5)
+weekly_summary_cache = TTLCache(maxsize=8, ttl=60)
+data_version = 0
+
+
+def invalidate_response_caches():
+    """Make cached /status and /summary/weekly responses stale after a write"""
+    global data_version
+    data_version += 1
+
+
 app = FastAPI(
     title="M-Pesa Spending Tracker",
     description="Backend API for tracking M-Pesa transactions and managing spending limits",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 
@@ -25,13 +61,57 @@ class SmsPayload(BaseModel):
     timestamp: int
 
 
+RECONCILIATION_INTERVAL_SECONDS = 15 * 60
+
+
+def reconcile_daily_limit(day: date):
+    """Recompute the stored running total for a day from its transactions"""
+    from app.agent import SpendingAgent
+
+    db = SessionLocal()
+    try:
+        SpendingAgent(db).reconcile_daily_limit(day)
+        invalidate_response_caches()
+    finally:
+        db.close()
+
+
+async def periodic_reconciliation():
+    """Reconcile today's running total every few minutes and close out each day after midnight"""
+    last_day = date.today()
+    while True:
+        await asyncio.sleep(RECONCILIATION_INTERVAL_SECONDS)
+        today = date.today()
+        try:
+            if today != last_day:
+                await asyncio.to_thread(reconcile_daily_limit, last_day)
+            await asyncio.to_thread(reconcile_daily_limit, today)
+            last_day = today
+            logger.debug("✅ Daily spending reconciled")
+        except Exception as e:
+            logger.error("❌ Error reconciling daily spending: %s", e)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
+    log_listener.start()
     init_db()
-    print("✅ Database initialized")
-    print(f"📊 Daily spending limit: Ksh{settings.daily_limit:,.2f}")
-    print(f"⚠️  Warning threshold: {settings.warning_threshold * 100}%")
+    app.state.reconciliation_task = asyncio.create_task(periodic_reconciliation())
+    logger.info("✅ Database initialized")
+    logger.info("📊 Daily spending limit: Ksh%s", f"{settings.daily_limit:,.2f}")
+    logger.info("⚠️  Warning threshold: %s%%", settings.warning_threshold * 100)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background jobs, flush logs and release pooled Slack connections on shutdown"""
+    app.state.reconciliation_task.cancel()
+    # Only close the Slack client if something actually imported it
+    slack = sys.modules.get("app.slack")
+    if slack is not None:
+        await slack.close_client()
+    log_listener.stop()
 
 
 @app.get("/")
@@ -46,21 +126,26 @@ async def root():
 
 
 @app.post("/webhook/sms")
-async def receive_sms(payload: SmsPayload, db: Session = Depends(get_db)):
+async def receive_sms(payload: SmsPayload, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """
     Receive SMS from Android app, parse M-Pesa transaction, 
-    update database, and send Slack notification
+    update database, and queue Slack notification
     """
+    from app.parser import MpesaParser
+    from app.agent import SpendingAgent
+    from app.slack import send_slack_notification
+
     try:
-        print(f"\n📱 Received SMS from: {payload.sender}")
-        print(f"📄 Message: {payload.message[:100]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("📱 Received SMS from: %s", payload.sender)
+            logger.info("📄 Message: %s...", payload.message[:100])
 
         # Handle test messages from Android app
         if payload.sender == "TEST" or "test" in payload.message.lower():
-            print("🧪 Test message detected - sending Slack notification")
+            logger.info("🧪 Test message detected - sending Slack notification")
             test_message = "🧪 **Test Message Received!**\n\n✅ Your M-Pesa tracker is working perfectly!\n\nThe app can now forward SMS to the backend, and you'll get notifications for real M-Pesa transactions."
-            await send_slack_notification(test_message)
-            return JSONResponse(
+            background_tasks.add_task(send_slack_notification, test_message)
+            return ORJSONResponse(
                 status_code=200,
                 content={"status": "success", "message": "Test notification sent to Slack"}
             )
@@ -69,63 +154,59 @@ async def receive_sms(payload: SmsPayload, db: Session = Depends(get_db)):
         parsed = MpesaParser.parse(payload.sender, payload.message)
         
         if not parsed["parsed_successfully"]:
-            print("⚠️ Failed to parse M-Pesa message")
-            return JSONResponse(
+            logger.warning("⚠️ Failed to parse M-Pesa message")
+            return ORJSONResponse(
                 status_code=200,
                 content={"status": "received", "parsed": False, "reason": "Could not extract transaction details"}
             )
 
-        # Check if transaction already exists
-        existing = db.query(Transaction).filter(
-            Transaction.transaction_code == parsed["transaction_code"]
-        ).first()
-
-        if existing:
-            print(f"⚠️ Duplicate transaction: {parsed['transaction_code']}")
-            return JSONResponse(
+        # Save transaction, skipping it atomically if the code was already recorded
+        transaction_id = db.execute(INSERT_TRANSACTION, {
+            "transaction_code": parsed["transaction_code"],
+            "transaction_type": parsed["transaction_type"],
+            "amount": parsed["amount"],
+            "recipient": parsed["recipient"],
+            "balance": parsed["balance"],
+            "raw_message": parsed["raw_message"],
+            "sender": parsed["sender"],
+            "processed": True
+        }).scalar()
+
+        if transaction_id is None:
+            logger.info("⚠️ Duplicate transaction: %s", parsed["transaction_code"])
+            return ORJSONResponse(
                 status_code=200,
                 content={"status": "duplicate", "transaction_code": parsed["transaction_code"]}
             )
 
-        # Save transaction to database
-        transaction = Transaction(
-            transaction_code=parsed["transaction_code"],
-            transaction_type=parsed["transaction_type"],
-            amount=parsed["amount"],
-            recipient=parsed["recipient"],
-            balance=parsed["balance"],
-            raw_message=parsed["raw_message"],
-            sender=parsed["sender"],
-            processed=False
-        )
-        db.add(transaction)
-        db.commit()
-        db.refresh(transaction)
-
-        print(f"✅ Transaction saved: {parsed['transaction_code']} - {parsed['transaction_type']} Ksh{parsed['amount']}")
-
         # Initialize spending agent
         agent = SpendingAgent(db)
-        
-        # Update daily spending if it's an outgoing transaction
+
+        # The insert and the running-total increment commit together, so a failure in between
+        # stores neither and the phone's retry isn't rejected as a duplicate
+        daily_limit = None
         if parsed["transaction_type"] in ["SENT", "WITHDRAWN", "BOUGHT", "PAYBILL"]:
-            agent.update_daily_limit(parsed["amount"])
+            daily_limit = agent.update_daily_limit(parsed["amount"])
+        else:
+            db.commit()
+        invalidate_response_caches()
+
+        logger.info(
+            "✅ Transaction saved: %s - %s Ksh%s",
+            parsed["transaction_code"], parsed["transaction_type"], parsed["amount"]
+        )
 
         # Get spending status
-        spending_status = agent.check_spending_status()
+        spending_status = agent.check_spending_status(daily_limit)
         
         # Generate intelligent message
         message = agent.generate_message(parsed, spending_status)
 
-        # Send Slack notification if configured
+        # Send Slack notification after the response so the phone isn't kept waiting
         if agent.should_notify(parsed["transaction_type"]):
-            await send_slack_notification(message)
+            background_tasks.add_task(send_slack_notification, message)
 
-        # Mark transaction as processed
-        transaction.processed = True
-        db.commit()
-
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=200,
             content={
                 "status": "success",
@@ -138,50 +219,75 @@ async def receive_sms(payload: SmsPayload, db: Session = Depends(get_db)):
         )
 
     except Exception as e:
-        print(f"❌ Error processing SMS: {str(e)}")
+        logger.error("❌ Error processing SMS: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/status")
 async def get_spending_status(db: Session = Depends(get_db)):
     """Get current spending status"""
-    agent = SpendingAgent(db)
-    status = agent.check_spending_status()
+    from app.agent import SpendingAgent
+
+    key = (date.today().isoformat(), data_version)
+    status = status_cache.get(key)
+    if status is None:
+        agent = SpendingAgent(db)
+        status = status_cache[key] = agent.check_spending_status()
     return status
 
 
 @app.get("/summary/weekly")
 async def get_weekly_summary(db: Session = Depends(get_db)):
     """Get weekly spending summary"""
-    agent = SpendingAgent(db)
-    summary = agent.get_weekly_summary()
+    from app.agent import SpendingAgent
+
+    key = (date.today().isoformat(), data_version)
+    summary = weekly_summary_cache.get(key)
+    if summary is None:
+        agent = SpendingAgent(db)
+        summary = weekly_summary_cache[key] = agent.get_weekly_summary()
     return summary
 
 
 @app.get("/transactions")
 async def get_transactions(limit: int = 50, db: Session = Depends(get_db)):
     """Get recent transactions"""
-    transactions = db.query(Transaction).order_by(
-        Transaction.timestamp.desc()
-    ).limit(limit).all()
-    
+    # Select only the listed columns; full rows would also load raw_message
+    # Server-side timestamps have millisecond resolution on SQLite, so break ties by insertion order
+    rows = db.execute(
+        select(
+            Transaction.id,
+            Transaction.transaction_code,
+            Transaction.transaction_type,
+            Transaction.amount,
+            Transaction.recipient,
+            Transaction.balance,
+            Transaction.timestamp
+        ).order_by(
+            Transaction.timestamp.desc(),
+            Transaction.id.desc()
+        ).limit(limit)
+    ).all()
+
     return [
         {
-            "id": t.id,
-            "code": t.transaction_code,
-            "type": t.transaction_type,
-            "amount": t.amount,
-            "recipient": t.recipient,
-            "balance": t.balance,
-            "timestamp": t.timestamp.isoformat(),
+            "id": row.id,
+            "code": row.transaction_code,
+            "type": row.transaction_type,
+            "amount": row.amount,
+            "recipient": row.recipient,
+            "balance": row.balance,
+            "timestamp": row.timestamp.isoformat(),
         }
-        for t in transactions
+        for row in rows
     ]
 
 
 @app.post("/test/slack")
 async def test_slack():
     """Test Slack integration"""
+    from app.slack import send_test_message
+
     if not settings.slack_webhook_url:
         raise HTTPException(status_code=400, detail="Slack webhook URL not configured")
     
@@ -1,14 +1,19 @@
+import logging
 import httpx
 from app.config import get_settings
 from typing import Optional
 
 settings = get_settings()
+logger = logging.getLogger("mpesa.slack")
+
+# Shared client so notifications reuse pooled connections instead of a new TLS handshake each time
+_client = httpx.AsyncClient(timeout=10.0)
 
 
 async def send_slack_notification(message: str) -> bool:
     """Send notification to Slack via webhook"""
     if not settings.slack_webhook_url:
-        print("⚠️ Slack webhook URL not configured")
+        logger.warning("⚠️ Slack webhook URL not configured")
         return False
 
     payload = {
@@ -18,24 +23,28 @@ async def send_slack_notification(message: str) -> bool:
     }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                settings.slack_webhook_url,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                print(f"✅ Slack notification sent successfully")
-                return True
-            else:
-                print(f"❌ Slack notification failed: {response.status_code}")
-                return False
+        response = await _client.post(
+            settings.slack_webhook_url,
+            json=payload
+        )
+
+        if response.status_code == 200:
+            logger.info("✅ Slack notification sent successfully")
+            return True
+        else:
+            logger.error("❌ Slack notification failed: %s", response.status_code)
+            return False
 
     except Exception as e:
-        print(f"❌ Error sending Slack notification: {str(e)}")
+        logger.error("❌ Error sending Slack notification: %s", e)
         return False
 
 
+async def close_client():
+    """Close the shared Slack HTTP client"""
+    await _client.aclose()
+
+
 async def send_test_message() -> bool:
     """Send a test message to Slack"""
     test_message = "🧪 Test message from M-Pesa Tracker!\n\nIf you see this, the integration is working perfectly."